@@ -0,0 +1,47 @@
+"""
+配置工具模块
+为主程序与各客户端提供统一的配置文件解析（带缓存）
+"""
+
+import os
+from functools import lru_cache
+from typing import Any, Dict
+
+import yaml
+
+# 优先使用libyaml的C实现解析配置，未编译libyaml时回退到纯Python实现
+_YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+@lru_cache(maxsize=4)
+def _parse_config(config_path: str, mtime: float) -> Dict[str, Any]:
+    """
+    解析配置文件，按(路径, 修改时间)缓存
+
+    Args:
+        config_path: 配置文件绝对路径
+        mtime: 配置文件修改时间
+
+    Returns:
+        配置字典
+    """
+    with open(config_path, 'r', encoding='utf-8') as f:
+        return yaml.load(f, Loader=_YamlLoader)
+
+
+def parse_config(config_path: str) -> Dict[str, Any]:
+    """
+    解析配置文件，文件未修改时直接返回上次的解析结果
+
+    Args:
+        config_path: 配置文件路径
+
+    Returns:
+        配置字典（各调用方共享，不应修改）
+
+    Raises:
+        OSError: 文件不存在或无法读取
+        yaml.YAMLError: 文件不是合法YAML
+    """
+    config_path = os.path.abspath(config_path)
+    return _parse_config(config_path, os.path.getmtime(config_path))
@@ -6,26 +6,73 @@ Finnhub API客户端模块
 import logging
 import requests
 import time
-from typing import Dict, List, Any, Optional
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import lru_cache
+from operator import itemgetter
+from typing import Dict, List, Any, Optional, Callable, Tuple
 from datetime import datetime
 import json
 
+from http_utils import DEFAULT_POOL_SIZE, DEFAULT_SESSION, create_session, json_loads
+from rate_limiter import AimdLimiter, CircuitOpenError, TokenBucket
+
+
+# Finnhub文档规定的每秒请求上限（与套餐无关）
+MAX_CALLS_PER_SECOND = 30
+
+# Finnhub quote响应字段：当前价、变动、变动百分比、最高、最低、开盘、前收盘
+_QUOTE_FIELDS = itemgetter('c', 'd', 'dp', 'h', 'l', 'o', 'pc')
+
+
+@lru_cache(maxsize=256)
+def _crypto_symbol(symbol: str, exchange: str) -> str:
+    """
+    生成Finnhub加密货币代码（定时轮询的交易对固定，结果缓存复用）
+    
+    Args:
+        symbol: 交易对，如 "BTCUSDT"
+        exchange: 交易所，如 "BINANCE"
+        
+    Returns:
+        Finnhub格式代码，如 "BINANCE:BTCUSDT"
+    """
+    return f"{exchange}:{symbol}"
+
 
 class FinnhubClient:
     """Finnhub API客户端"""
     
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], session: Optional[requests.Session] = None):
         """
         初始化Finnhub客户端
         
         Args:
             config: 配置字典
+            session: HTTP会话，默认使用进程内共享的会话（测试时应注入独立会话，避免用例间互相影响）
         """
         self.config = config
         self.finnhub_config = config.get('finnhub', {})
         self.api_key = self.finnhub_config.get('api_key')
         self.base_url = self.finnhub_config.get('base_url', 'https://finnhub.io/api/v1')
-        self.session = requests.Session()
+        # 批量请求的并发线程数（I/O密集，线程大部分时间在等待网络）
+        self.workers = max(1, int(self.finnhub_config.get('workers', 8)))
+        # 共享会话的连接池不足以让每个线程都复用keep-alive连接时，单独创建会话
+        if session is None:
+            session = DEFAULT_SESSION if self.workers <= DEFAULT_POOL_SIZE else create_session(pool_size=self.workers)
+        self.session = session
+        # 限流分三层，各司其职：
+        # - 令牌桶：所有线程共享，按分钟窗口控制请求额度（rate_per_minute，一次运行的标的少于额度时可直接突发），
+        #   并叠加Finnhub每秒30次的上限；rate_per_minute不为正数时只保留每秒上限
+        # - AIMD：只控制同时进行的请求数，从workers开始，遇到429/5xx/超时时收缩，连续失败时熔断
+        # - 会话的urllib3 Retry：唯一负责429/5xx的退避重试（遵循Retry-After），AIMD只观察重试后的最终响应
+        rate_per_minute = self.finnhub_config.get('rate_per_minute', 60)
+        self.rate_limits = []
+        if rate_per_minute > 0:
+            self.rate_limits.append(TokenBucket(capacity=rate_per_minute, refill_per_sec=rate_per_minute / 60))
+        self.rate_limits.append(TokenBucket(capacity=MAX_CALLS_PER_SECOND, refill_per_sec=MAX_CALLS_PER_SECOND))
+        self.limiter = AimdLimiter(c_max=self.workers)
+        # 最近一次生成的时间戳缓存 (秒级时间戳, ISO格式时间)
+        self._last_stamp: Tuple[int, str] = (0, '')
         self.logger = logging.getLogger(__name__)
         
         if not self.api_key:
@@ -51,24 +98,114 @@ class FinnhubClient:
                 params = {}
             params['token'] = self.api_key
             
-            response = self.session.get(url, params=params, timeout=30)
+            for bucket in self.rate_limits:
+                bucket.acquire()
+            with self.limiter.slot():
+                response = self.session.get(url, params=params, timeout=30)
+            self.limiter.observe(response.status_code, response.headers.get('Retry-After'))
             response.raise_for_status()
             
-            return response.json()
+            return json_loads(response.content)
             
+        except CircuitOpenError as e:
+            self.logger.warning("API请求被跳过: %s", e)
+            return None
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            self.limiter.on_error()
+            self.logger.error("API请求失败: %s", e)
+            return None
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 429:
+                self.logger.warning("API请求被限流，重试后仍失败 (Retry-After: %s)", e.response.headers.get('Retry-After'))
+            else:
+                self.logger.error("API请求失败: %s", e)
+            return None
         except requests.exceptions.RequestException as e:
-            self.logger.error(f"API请求失败: {e}")
+            self.logger.error("API请求失败: %s", e)
             return None
         except json.JSONDecodeError as e:
-            self.logger.error(f"JSON解析失败: {e}")
+            self.logger.error("JSON解析失败: %s", e)
             return None
     
-    def get_stock_quote(self, symbol: str) -> Optional[Dict[str, Any]]:
+    def _fan_out(self, func: Callable[..., Optional[Dict[str, Any]]], args_list: List[tuple],
+                 executor: Optional[Executor] = None) -> List[Dict[str, Any]]:
+        """
+        并发执行多个单次查询，共享同一个Session的keep-alive连接池
+        
+        Args:
+            func: 单次查询方法
+            args_list: 每次调用的参数元组列表
+            executor: 调用方共享的线程池（如主程序的fetch_pool），为None时使用按workers大小创建的临时线程池
+            
+        Returns:
+            成功结果列表（保持输入顺序，失败项被过滤）
+        """
+        if not args_list:
+            return []
+        
+        if executor is not None:
+            results = executor.map(lambda args: func(*args), args_list)
+            return [result for result in results if result]
+        
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(args_list))) as own_executor:
+            results = own_executor.map(lambda args: func(*args), args_list)
+            return [result for result in results if result]
+    
+    def _stamp(self, ts: Optional[int] = None) -> Tuple[int, str]:
+        """
+        获取时间戳及对应的ISO格式时间（同一秒内复用缓存）
+        
+        Args:
+            ts: 秒级时间戳，默认为当前时间
+            
+        Returns:
+            (时间戳, ISO格式时间)
+        """
+        if ts is None:
+            ts = int(time.time())
+        if ts != self._last_stamp[0]:
+            self._last_stamp = (ts, datetime.fromtimestamp(ts).isoformat())
+        return self._last_stamp
+    
+    def _build_quote(self, data: Dict[str, Any], stamp: Tuple[int, str], price_key: str, **identity: str) -> Dict[str, Any]:
+        """
+        将Finnhub报价响应转换为统一的报价数据
+        
+        Args:
+            data: Finnhub quote接口响应
+            stamp: (时间戳, ISO格式时间)，响应不含报价时间时使用
+            price_key: 当前价格字段名
+            **identity: 标识字段，如symbol、exchange
+            
+        Returns:
+            报价数据
+        """
+        # 优先使用Finnhub返回的报价时间，休市期间该时间不变，便于下游跳过重复推送；
+        # 各报价时间不同，在本地格式化，不写入批量共用的时间戳缓存
+        quote_time = data.get('t')
+        if quote_time:
+            stamp = (int(quote_time), datetime.fromtimestamp(int(quote_time)).isoformat())
+        c, d, dp, h, l, o, pc = _QUOTE_FIELDS(data)
+        return {
+            **identity,
+            price_key: c,               # 当前价格
+            'change': d,                # 价格变动
+            'percent_change': dp,       # 百分比变动
+            'high': h,                  # 最高价
+            'low': l,                   # 最低价
+            'open': o,                  # 开盘价
+            'previous_close': pc,       # 前收盘价
+            'timestamp': stamp[0],
+            'datetime': stamp[1]
+        }
+    
+    def get_stock_quote(self, symbol: str, stamp: Optional[Tuple[int, str]] = None) -> Optional[Dict[str, Any]]:
         """
         获取股票实时报价
         
         Args:
             symbol: 股票代码
+            stamp: 批量请求共用的(时间戳, ISO格式时间)，仅在响应不含报价时间时使用，默认为当前时间
             
         Returns:
             股票报价数据
@@ -77,108 +214,76 @@ class FinnhubClient:
             data = self._make_request('quote', {'symbol': symbol})
             
             if data and 'c' in data:  # 'c' 是当前价格
-                return {
-                    'symbol': symbol,
-                    'current_price': data.get('c'),  # 当前价格
-                    'change': data.get('d'),         # 价格变动
-                    'percent_change': data.get('dp'), # 百分比变动
-                    'high': data.get('h'),           # 最高价
-                    'low': data.get('l'),            # 最低价
-                    'open': data.get('o'),           # 开盘价
-                    'previous_close': data.get('pc'), # 前收盘价
-                    'timestamp': int(time.time()),
-                    'datetime': datetime.now().isoformat()
-                }
+                return self._build_quote(data, stamp or self._stamp(), 'current_price', symbol=symbol)
             else:
-                self.logger.warning(f"获取股票 {symbol} 数据失败或数据格式异常")
+                self.logger.warning("获取股票 %s 数据失败或数据格式异常", symbol)
                 return None
                 
         except Exception as e:
-            self.logger.error(f"获取股票 {symbol} 报价失败: {e}")
+            self.logger.error("获取股票 %s 报价失败: %s", symbol, e)
             return None
     
     
-    def get_crypto_price(self, symbol: str, exchange: str = "BINANCE") -> Optional[Dict[str, Any]]:
+    def get_crypto_price(self, symbol: str, exchange: str = "BINANCE", stamp: Optional[Tuple[int, str]] = None) -> Optional[Dict[str, Any]]:
         """
         获取加密货币价格
         
         Args:
             symbol: 交易对，如 "BTCUSDT"
             exchange: 交易所，默认为 "BINANCE"
+            stamp: 批量请求共用的(时间戳, ISO格式时间)，仅在响应不含报价时间时使用，默认为当前时间
             
         Returns:
             加密货币价格数据
         """
         try:
             # Finnhub加密货币格式: BINANCE:BTCUSDT
-            finnhub_symbol = f"{exchange}:{symbol}"
+            finnhub_symbol = _crypto_symbol(symbol, exchange)
             
             data = self._make_request('quote', {'symbol': finnhub_symbol})
             
             if data and 'c' in data:
-                return {
-                    'symbol': symbol,
-                    'exchange': exchange,
-                    'price': data.get('c'),          # 当前价格
-                    'change': data.get('d'),         # 价格变动
-                    'percent_change': data.get('dp'), # 百分比变动
-                    'high': data.get('h'),           # 最高价
-                    'low': data.get('l'),            # 最低价
-                    'open': data.get('o'),           # 开盘价
-                    'previous_close': data.get('pc'), # 前收盘价
-                    'timestamp': int(time.time()),
-                    'datetime': datetime.now().isoformat()
-                }
+                return self._build_quote(data, stamp or self._stamp(), 'price', symbol=symbol, exchange=exchange)
             else:
-                self.logger.warning(f"获取加密货币 {symbol} 数据失败或数据格式异常")
+                self.logger.warning("获取加密货币 %s 数据失败或数据格式异常", symbol)
                 return None
                 
         except Exception as e:
-            self.logger.error(f"获取加密货币 {symbol} 价格失败: {e}")
+            self.logger.error("获取加密货币 %s 价格失败: %s", symbol, e)
             return None
     
-    def get_multiple_stocks(self, symbols: List[str]) -> List[Dict[str, Any]]:
+    def get_multiple_stocks(self, symbols: List[str], executor: Optional[Executor] = None) -> List[Dict[str, Any]]:
         """
         批量获取多个股票报价
         
         Args:
             symbols: 股票代码列表
+            executor: 共享的线程池，为None时按workers大小并发请求
             
         Returns:
             股票报价数据列表
         """
-        results = []
-        for symbol in symbols:
-            quote = self.get_stock_quote(symbol)
-            if quote:
-                results.append(quote)
-            # 添加延迟避免API限制
-            time.sleep(0.1)
-        
-        return results
+        stamp = self._stamp()
+        return self._fan_out(self.get_stock_quote, [(symbol, stamp) for symbol in symbols], executor)
     
     
-    def get_multiple_crypto(self, crypto_list: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    def get_multiple_crypto(self, crypto_list: List[Dict[str, str]], executor: Optional[Executor] = None) -> List[Dict[str, Any]]:
         """
         批量获取多个加密货币价格
         
         Args:
             crypto_list: 加密货币列表，包含symbol和exchange
+            executor: 共享的线程池，为None时按workers大小并发请求
             
         Returns:
             加密货币价格数据列表
         """
-        results = []
-        for crypto in crypto_list:
-            symbol = crypto.get('symbol')
-            exchange = crypto.get('exchange', 'BINANCE')
-            price = self.get_crypto_price(symbol, exchange)
-            if price:
-                results.append(price)
-            # 添加延迟避免API限制
-            time.sleep(0.1)
-        
-        return results
+        stamp = self._stamp()
+        args_list = [
+            (crypto.get('symbol'), crypto.get('exchange', 'BINANCE'), stamp)
+            for crypto in crypto_list
+        ]
+        return self._fan_out(self.get_crypto_price, args_list, executor)
 
 
 if __name__ == "__main__":
@@ -4,26 +4,40 @@
 """
 
 import logging
+import math
 import requests
+import threading
 import time
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
 import json
 
+from http_utils import DEFAULT_SESSION, json_loads
+from rate_limiter import AimdLimiter, CircuitOpenError
+
+
+# OpenExchangeRates免费版的基础货币，也是计算交叉汇率的桥梁货币
+USD = 'USD'
+
+# 批量计算交叉汇率时，货币对数量超过该阈值才使用NumPy向量化计算
+VECTORIZE_THRESHOLD = 32
+
 
 class ForexClient:
     """免费外汇API客户端"""
     
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], session: Optional[requests.Session] = None):
         """
         初始化外汇客户端
         
         Args:
             config: 配置字典
+            session: HTTP会话，默认使用进程内共享的会话（测试时应注入独立会话，避免用例间互相影响）
         """
         self.config = config
         self.forex_config = config.get('forex_apis', {})
-        self.session = requests.Session()
+        self.session = session or DEFAULT_SESSION
+        self.limiter = AimdLimiter(c_max=4)
         self.logger = logging.getLogger(__name__)
         
         # OpenExchangeRates API配置
@@ -33,34 +47,57 @@ class ForexClient:
             'rate_limit': 1000,  # 1000次/月
             'update_frequency': 3600  # 每小时更新一次（3600秒）
         }
+        
+        # 汇率缓存 {base: (获取时间戳, 全量汇率字典)}，有效期与API更新频率一致
+        self._rate_cache: Dict[str, Tuple[int, Dict[str, float]]] = {}
+        # 缓存对应的条件请求头 {base: {'If-None-Match': ETag, 'If-Modified-Since': Last-Modified}}
+        self._rate_validators: Dict[str, Dict[str, str]] = {}
+        self._rate_cache_lock = threading.Lock()
+        # 进行中的上游请求 {缓存键: 完成事件}，用于合并并发请求
+        self._in_flight: Dict[str, threading.Event] = {}
+        # 最近一次汇率表的NumPy映射 (汇率表, 货币索引, 汇率向量)
+        self._usd_vector_cache: Optional[Tuple[Dict[str, float], Dict[str, int], Any]] = None
     
-    def _make_request(self, url: str, params: Dict[str, Any] = None, timeout: int = 30) -> Optional[Dict]:
+    def _send(self, url: str, params: Dict[str, Any] = None, timeout: int = 30,
+              headers: Optional[Dict[str, str]] = None) -> Optional[requests.Response]:
         """
-        发起HTTP请求
+        发起HTTP GET请求
         
         Args:
             url: 请求URL
             params: 请求参数
             timeout: 超时时间
+            headers: 额外的请求头
             
         Returns:
-            API响应数据
+            HTTP响应（状态码小于400），失败时返回None
         """
         try:
-            response = self.session.get(url, params=params, timeout=timeout)
+            with self.limiter.slot():
+                response = self.session.get(url, params=params, timeout=timeout, headers=headers)
+            self.limiter.observe(response.status_code, response.headers.get('Retry-After'))
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            self.logger.error(f"HTTP请求失败: {e}")
+            return response
+        except CircuitOpenError as e:
+            self.logger.warning("HTTP请求被跳过: %s", e)
             return None
-        except json.JSONDecodeError as e:
-            self.logger.error(f"JSON解析失败: {e}")
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            self.limiter.on_error()
+            self.logger.error("HTTP请求失败: %s", e)
+            return None
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 429:
+                self.logger.warning("请求被限流，重试后仍失败 (Retry-After: %s)", e.response.headers.get('Retry-After'))
+            else:
+                self.logger.error("HTTP请求失败: %s", e)
+            return None
+        except requests.exceptions.RequestException as e:
+            self.logger.error("HTTP请求失败: %s", e)
             return None
-    
     
     def _get_usd_rates(self, symbols: List[str]) -> Optional[Dict[str, float]]:
         """
-        从OpenExchangeRates获取以USD为基础的汇率
+        从OpenExchangeRates获取以USD为基础的汇率（优先使用缓存）
         
         Args:
             symbols: 目标货币列表
@@ -68,28 +105,117 @@ class ForexClient:
         Returns:
             汇率字典 {currency: rate}
         """
+        rates = self._get_usd_rate_table()
+        if rates is None:
+            return None
+        
+        return {symbol: rates[symbol] for symbol in symbols if symbol in rates}
+    
+    def _get_usd_rate_table(self) -> Optional[Dict[str, float]]:
+        """
+        获取以USD为基础的全量汇率表（优先使用缓存）
+        
+        缓存有效期内返回同一个字典对象，调用方不应修改。
+        并发调用在缓存失效时合并为一次上游请求，其余调用等待其结果。
+        
+        Returns:
+            全量汇率字典 {currency: rate}
+        """
         try:
             if not self.api_config.get('api_key'):
                 self.logger.error("OpenExchangeRates API密钥未配置")
                 return None
+            
+            cache_key = USD
+            now = int(time.time())
+            
+            with self._rate_cache_lock:
+                cached = self._rate_cache.get(cache_key)
+                if cached and now - cached[0] < self.api_config['update_frequency']:
+                    return cached[1]
                 
-            url = f"{self.api_config['base_url']}/latest.json"
-            params = {
-                'app_id': self.api_config['api_key'],
-                'base': 'USD',
-                'symbols': ','.join(symbols)
-            }
+                event = self._in_flight.get(cache_key)
+                is_leader = event is None
+                if is_leader:
+                    event = threading.Event()
+                    self._in_flight[cache_key] = event
+                validators = self._rate_validators.get(cache_key)
             
-            data = self._make_request(url, params)
+            if not is_leader:
+                # 已有请求在进行中，等待其完成后直接读取缓存
+                event.wait()
+                with self._rate_cache_lock:
+                    cached = self._rate_cache.get(cache_key)
+                if cached and now - cached[0] < self.api_config['update_frequency']:
+                    return cached[1]
+                return None
             
-            if data and 'rates' in data:
-                return data['rates']
+            try:
+                return self._fetch_usd_rate_table(cache_key, now, cached, validators)
+            finally:
+                with self._rate_cache_lock:
+                    self._in_flight.pop(cache_key, None)
+                event.set()
             
+        except Exception as e:
+            self.logger.error("获取USD汇率失败: %s", e)
             return None
+    
+    def _fetch_usd_rate_table(self, cache_key: str, now: int,
+                              cached: Optional[Tuple[int, Dict[str, float]]],
+                              validators: Optional[Dict[str, str]]) -> Optional[Dict[str, float]]:
+        """
+        从OpenExchangeRates拉取全量USD汇率表并写入缓存
+        
+        Args:
+            cache_key: 缓存键
+            now: 当前时间戳
+            cached: 已过期的缓存（如有）
+            validators: 缓存对应的条件请求头
             
-        except Exception as e:
-            self.logger.error(f"获取USD汇率失败: {e}")
+        Returns:
+            全量汇率字典 {currency: rate}
+        """
+        # 不限定symbols，一次获取全部货币，后续请求直接从缓存中切片
+        url = f"{self.api_config['base_url']}/latest.json"
+        params = {
+            'app_id': self.api_config['api_key'],
+            'base': USD
+        }
+        
+        # 已有缓存时发送条件请求，上游未更新则返回304且无响应体
+        response = self._send(url, params, headers=validators if cached else None)
+        if response is None:
             return None
+        
+        if response.status_code == 304 and cached:
+            self.logger.debug("USD汇率未变化，继续使用缓存")
+            rates = cached[1]
+        else:
+            try:
+                data = json_loads(response.content)
+            except json.JSONDecodeError as e:
+                self.logger.error("JSON解析失败: %s", e)
+                return None
+            
+            if not data or 'rates' not in data:
+                return None
+            
+            rates = data['rates']
+            validators = {
+                header: value
+                for header, value in (
+                    ('If-None-Match', response.headers.get('ETag')),
+                    ('If-Modified-Since', response.headers.get('Last-Modified'))
+                )
+                if value
+            }
+        
+        with self._rate_cache_lock:
+            self._rate_cache[cache_key] = (now, rates)
+            self._rate_validators[cache_key] = validators
+        
+        return rates
     
     def _calculate_cross_rate(self, base: str, target: str, usd_rates: Dict[str, float]) -> Optional[float]:
         """
@@ -104,10 +230,10 @@ class ForexClient:
             交叉汇率
         """
         try:
-            if base == 'USD':
-                # USD/TARGET
-                return usd_rates.get(target)
-            elif target == 'USD':
+            if base == USD:
+                # USD/TARGET，汇率为0视为缺失（与向量化路径一致）
+                return usd_rates.get(target) or None
+            elif target == USD:
                 # BASE/USD = 1 / (USD/BASE)
                 usd_base_rate = usd_rates.get(base)
                 if usd_base_rate and usd_base_rate != 0:
@@ -123,9 +249,92 @@ class ForexClient:
                 return None
                 
         except Exception as e:
-            self.logger.error(f"计算交叉汇率失败: {e}")
+            self.logger.error("计算交叉汇率失败: %s", e)
             return None
     
+    def _calculate_cross_rates(self, pairs: List[Tuple[str, str]], usd_rates: Dict[str, float]) -> List[Optional[float]]:
+        """
+        批量计算交叉汇率（货币对较多时使用NumPy向量化计算）
+        
+        Args:
+            pairs: (基础货币, 目标货币) 列表
+            usd_rates: USD汇率字典
+            
+        Returns:
+            与pairs一一对应的交叉汇率列表，无法计算（汇率缺失或为0）的为None
+        """
+        if len(pairs) <= VECTORIZE_THRESHOLD:
+            return [self._calculate_cross_rate(base, target, usd_rates) for base, target in pairs]
+        
+        # 仅在大批量时导入NumPy，避免常规路径的导入开销
+        import numpy as np
+        
+        index, usd_vec = self._get_usd_vector(usd_rates)
+        missing = len(usd_vec) - 1
+        
+        base_idx = np.fromiter((index.get(base, missing) for base, _ in pairs), dtype=np.intp, count=len(pairs))
+        target_idx = np.fromiter((index.get(target, missing) for _, target in pairs), dtype=np.intp, count=len(pairs))
+        
+        # BASE/TARGET = (USD/TARGET) / (USD/BASE)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = usd_vec[target_idx] / usd_vec[base_idx]
+        
+        return [rate if math.isfinite(rate) else None for rate in rates.tolist()]
+    
+    def _get_usd_vector(self, usd_rates: Dict[str, float]) -> Tuple[Dict[str, int], Any]:
+        """
+        将USD汇率字典映射为NumPy向量及货币索引（同一汇率表只构建一次）
+        
+        Args:
+            usd_rates: USD汇率字典
+            
+        Returns:
+            (货币索引, 汇率向量)，向量末尾依次为USD（=1）和缺失货币占位（NaN）
+        """
+        cached = self._usd_vector_cache
+        if cached is not None and cached[0] is usd_rates:
+            return cached[1], cached[2]
+        
+        import numpy as np
+        
+        currencies = [currency for currency in usd_rates if currency != USD]
+        index = {currency: i for i, currency in enumerate(currencies)}
+        index[USD] = len(currencies)
+        values = [usd_rates[currency] or math.nan for currency in currencies] + [1.0, math.nan]
+        usd_vec = np.array(values, dtype=np.float64)
+        
+        self._usd_vector_cache = (usd_rates, index, usd_vec)
+        return index, usd_vec
+    
+    def _build_forex_result(self, pair: str, rate: float, source: str, stamp: Optional[Tuple[int, str]] = None) -> Dict[str, Any]:
+        """
+        构建汇率数据字典
+        
+        Args:
+            pair: 货币对
+            rate: 汇率
+            source: 数据来源
+            stamp: 批量请求共用的(时间戳, ISO格式时间)，默认为当前时间
+            
+        Returns:
+            汇率数据
+        """
+        if stamp is None:
+            stamp = (int(time.time()), datetime.now().isoformat())
+        return {
+            'pair': pair,
+            'rate': rate,
+            'change': 0,
+            'percent_change': 0,
+            'high': rate,
+            'low': rate,
+            'open': rate,
+            'previous_close': rate,
+            'timestamp': stamp[0],
+            'datetime': stamp[1],
+            'source': source
+        }
+    
     def _get_forex_rate(self, pair: str) -> Optional[Dict[str, Any]]:
         """
         从Open Exchange Rates获取汇率（支持USD桥梁货币）
@@ -141,63 +350,34 @@ class ForexClient:
                 self.logger.error("OpenExchangeRates API密钥未配置")
                 return None
                 
-            if '/' not in pair:
-                self.logger.error(f"无效的货币对格式: {pair}")
+            base, sep, target = pair.partition('/')
+            if not sep:
+                self.logger.error("无效的货币对格式: %s", pair)
                 return None
-                
-            base, target = pair.split('/')
             
             # 确定需要获取的USD汇率
-            symbols_needed = set()
-            if base != 'USD':
-                symbols_needed.add(base)
-            if target != 'USD':
-                symbols_needed.add(target)
+            symbols_needed = [currency for currency in (base, target) if currency != USD]
             
             # 如果两个货币都是USD，直接返回1
-            if base == target == 'USD':
-                return {
-                    'pair': pair,
-                    'rate': 1.0,
-                    'change': 0,
-                    'percent_change': 0,
-                    'high': 1.0,
-                    'low': 1.0,
-                    'open': 1.0,
-                    'previous_close': 1.0,
-                    'timestamp': int(time.time()),
-                    'datetime': datetime.now().isoformat(),
-                    'source': 'openexchangerates.org'
-                }
+            if base == target == USD:
+                return self._build_forex_result(pair, 1.0, 'openexchangerates.org')
             
             # 获取USD汇率
-            usd_rates = self._get_usd_rates(list(symbols_needed))
+            usd_rates = self._get_usd_rates(symbols_needed)
             if not usd_rates:
-                self.logger.error(f"无法获取USD汇率数据")
+                self.logger.error("无法获取USD汇率数据")
                 return None
             
             # 计算目标汇率
             rate = self._calculate_cross_rate(base, target, usd_rates)
             if rate is None:
-                self.logger.error(f"无法计算 {pair} 的汇率")
+                self.logger.error("无法计算 %s 的汇率", pair)
                 return None
             
-            return {
-                'pair': pair,
-                'rate': rate,
-                'change': 0,
-                'percent_change': 0,
-                'high': rate,
-                'low': rate,
-                'open': rate,
-                'previous_close': rate,
-                'timestamp': int(time.time()),
-                'datetime': datetime.now().isoformat(),
-                'source': 'openexchangerates.org (USD bridge)'
-            }
+            return self._build_forex_result(pair, rate, 'openexchangerates.org (USD bridge)')
             
         except Exception as e:
-            self.logger.error(f"Open Exchange Rates API请求失败: {e}")
+            self.logger.error("Open Exchange Rates API请求失败: %s", e)
             return None
     
     
@@ -224,7 +404,7 @@ class ForexClient:
         if time_diff < min_update_interval:
             remaining_time = min_update_interval - time_diff
             remaining_minutes = remaining_time // 60
-            self.logger.info(f"外汇 {pair} 距离上次更新不足1小时（还需等待 {remaining_minutes} 分钟），跳过API请求")
+            self.logger.debug("外汇 %s 距离上次更新不足1小时（还需等待 %s 分钟），跳过API请求", pair, remaining_minutes)
             return False
         
         return True
@@ -244,19 +424,19 @@ class ForexClient:
         if not self.should_update_forex_rate(pair, last_update_timestamp):
             return None
         
-        self.logger.debug(f"使用OpenExchangeRates获取 {pair} 汇率")
+        self.logger.debug("使用OpenExchangeRates获取 %s 汇率", pair)
         result = self._get_forex_rate(pair)
         
         if result:
-            self.logger.info(f"成功获取 {pair} 汇率: {result['rate']}")
+            self.logger.debug("成功获取 %s 汇率: %s", pair, result['rate'])
             return result
         else:
-            self.logger.error(f"无法获取 {pair} 汇率")
+            self.logger.error("无法获取 %s 汇率", pair)
             return None
     
     def get_multiple_forex_rates(self, pairs_with_timestamps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
-        批量获取多个外汇汇率
+        批量获取多个外汇汇率（所有货币对共用一次USD汇率请求）
         
         Args:
             pairs_with_timestamps: 包含货币对和上次更新时间的列表
@@ -265,16 +445,51 @@ class ForexClient:
         Returns:
             外汇汇率数据列表
         """
-        results = []
+        if not self.api_config.get('api_key'):
+            self.logger.error("OpenExchangeRates API密钥未配置")
+            return []
+        
+        # 筛选需要更新的货币对
+        pending = []
         for item in pairs_with_timestamps:
             pair = item.get('pair')
-            last_update = item.get('last_update')
+            if not pair or not self.should_update_forex_rate(pair, item.get('last_update')):
+                continue
+            
+            base, sep, target = pair.partition('/')
+            if not sep:
+                self.logger.error("无效的货币对格式: %s", pair)
+                continue
+            
+            pending.append((pair, base, target))
+        
+        if not pending:
+            return []
+        
+        # 一次请求获取所有涉及货币的USD汇率
+        # 直接使用全量汇率表，其NumPy映射在缓存有效期内可重复利用
+        usd_rates = {}
+        if any(currency != USD for _, base, target in pending for currency in (base, target)):
+            usd_rates = self._get_usd_rate_table()
+            if not usd_rates:
+                self.logger.error("无法获取USD汇率数据")
+                return []
+        
+        # 本地计算各货币对汇率，整批共用同一时间戳
+        stamp = (int(time.time()), datetime.now().isoformat())
+        rates = self._calculate_cross_rates([(base, target) for _, base, target in pending], usd_rates)
+        results = []
+        for (pair, base, target), rate in zip(pending, rates):
+            if base == target == USD:
+                results.append(self._build_forex_result(pair, 1.0, 'openexchangerates.org', stamp))
+                continue
+            
+            if rate is None:
+                self.logger.error("无法计算 %s 的汇率", pair)
+                continue
             
-            rate = self.get_forex_rate(pair, last_update)
-            if rate:
-                results.append(rate)
-            # 添加延迟避免API限制
-            time.sleep(0.1)
+            self.logger.debug("成功获取 %s 汇率: %s", pair, rate)
+            results.append(self._build_forex_result(pair, rate, 'openexchangerates.org (USD bridge)', stamp))
         
         return results
     
@@ -299,7 +514,7 @@ class ForexClient:
             return is_connected
             
         except Exception as e:
-            self.logger.error(f"测试OpenExchangeRates连通性失败: {e}")
+            self.logger.error("测试OpenExchangeRates连通性失败: %s", e)
             return False
 
 
@@ -0,0 +1,98 @@
+"""
+HTTP工具模块
+为各API客户端提供统一配置的requests会话（连接池与重试策略）
+"""
+
+import json
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:  # 未安装orjson时回退到标准库
+    orjson = None
+
+
+# 连接池大小
+DEFAULT_POOL_SIZE = 32
+
+# 需要自动重试的HTTP状态码
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+USER_AGENT = 'nofina/1.0'
+
+
+def create_session(pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+    """
+    创建带连接池和重试策略的HTTP会话
+
+    Args:
+        pool_size: 每个主机保持的keep-alive连接数
+
+    Returns:
+        配置好的requests会话
+    """
+    # 429/5xx的退避重试只在这一层进行（遵循Retry-After），客户端的限流器不再自行重试
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=RETRY_STATUS_CODES,
+        respect_retry_after_header=True,
+        # 重试耗尽后返回最后一次响应，由调用方根据状态码处理
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=retry,
+        # 连接池满时等待空闲连接，而不是新建一次性连接（避免额外的TCP/TLS握手）
+        pool_block=True
+    )
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    # requests默认的Accept-Encoding由urllib3按可用解码器生成（安装brotli后包含br），
+    # 响应由urllib3透明解压；不手动指定br，以免未安装brotli时无法解码
+    session.headers.update({'User-Agent': USER_AGENT})
+    return session
+
+
+def json_loads(content: bytes):
+    """
+    解析JSON响应体，优先使用orjson
+
+    Args:
+        content: 响应体原始字节
+
+    Returns:
+        解析后的对象
+
+    Raises:
+        json.JSONDecodeError: 内容不是合法JSON（orjson的异常同为其子类）
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def json_dumps(obj, indent: bool = False) -> bytes:
+    """
+    序列化为UTF-8编码的JSON，优先使用orjson
+
+    Args:
+        obj: 待序列化的对象
+        indent: 是否以两个空格缩进
+
+    Returns:
+        JSON字节串（非ASCII字符不转义）
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else None)
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None).encode('utf-8')
+
+
+# 各客户端默认共享的会话：urllib3按主机分别维护连接池，
+# Finnhub与OpenExchangeRates的连接互不占用，但各自在整个进程内复用
+DEFAULT_SESSION = create_session()
@@ -5,17 +5,36 @@ NoFina 主程序
 """
 
 import logging
-import os
+import logging.handlers
 import sys
-import time
-import json
+from collections import namedtuple
+from concurrent.futures import Executor, ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import Dict, Any, List
-import yaml
+from pathlib import Path
+from typing import Dict, Any, List, Callable, Iterator, Optional, Tuple
 
+from config_utils import parse_config
 from finnhub_client import FinnhubClient
 from notion_db_client import NotionClient
 from forex_client import ForexClient
+from http_utils import json_dumps
+
+# 脚本所在目录，相对路径均相对于该目录解析
+_SCRIPT_DIR = Path(__file__).resolve().parent
+
+
+def resolve_path(path: str) -> Path:
+    """
+    解析路径，相对路径相对于脚本所在目录
+    
+    Args:
+        path: 文件或目录路径
+        
+    Returns:
+        绝对路径
+    """
+    path = Path(path)
+    return path if path.is_absolute() else _SCRIPT_DIR / path
 
 
 def setup_logging(config: Dict[str, Any]) -> None:
@@ -27,24 +46,24 @@ def setup_logging(config: Dict[str, Any]) -> None:
     """
     log_config = config.get('logging', {})
     log_level = getattr(logging, log_config.get('level', 'INFO').upper())
-    log_file = log_config.get('file', './logs/nofina.log')
-    
-    # 如果是相对路径，则相对于脚本所在目录
-    if not os.path.isabs(log_file):
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        log_file = os.path.join(script_dir, log_file)
+    log_file = resolve_path(log_config.get('file', './logs/nofina.log'))
     
     # 创建日志目录
-    os.makedirs(os.path.dirname(log_file), exist_ok=True)
+    log_file.parent.mkdir(parents=True, exist_ok=True)
     
     # 配置日志格式
     formatter = logging.Formatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
     
-    # 文件处理器
+    # 文件处理器：经MemoryHandler缓冲批量写入，遇到ERROR或缓冲满时立即落盘，退出时由logging.shutdown刷新
     file_handler = logging.FileHandler(log_file, encoding='utf-8')
     file_handler.setFormatter(formatter)
+    buffered_file_handler = logging.handlers.MemoryHandler(
+        capacity=200,
+        flushLevel=logging.ERROR,
+        target=file_handler
+    )
     
     # 控制台处理器
     console_handler = logging.StreamHandler(sys.stdout)
@@ -53,7 +72,7 @@ def setup_logging(config: Dict[str, Any]) -> None:
     # 配置根日志器
     root_logger = logging.getLogger()
     root_logger.setLevel(log_level)
-    root_logger.addHandler(file_handler)
+    root_logger.addHandler(buffered_file_handler)
     root_logger.addHandler(console_handler)
 
 
@@ -71,165 +90,138 @@ def save_data_to_file(data: List[Dict], data_type: str, config: Dict[str, Any])
     if not output_config.get('save_to_file', False):
         return
     
-    file_path = output_config.get('file_path', './data/')
-    
-    # 如果是相对路径，则相对于脚本所在目录
-    if not os.path.isabs(file_path):
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        file_path = os.path.join(script_dir, file_path)
-    
-    os.makedirs(file_path, exist_ok=True)
+    file_path = resolve_path(output_config.get('file_path', './data/'))
+    file_path.mkdir(parents=True, exist_ok=True)
     
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     filename = f"{data_type}_{timestamp}.json"
-    full_path = os.path.join(file_path, filename)
+    full_path = file_path / filename
     
     try:
-        with open(full_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with open(full_path, 'wb') as f:
+            f.write(json_dumps(data, indent=True))
         logging.info(f"数据已保存到文件: {full_path}")
     except Exception as e:
         logging.error(f"保存数据到文件失败: {e}")
 
 
-def process_stocks(finnhub_client: FinnhubClient, notion_client: NotionClient, config: Dict[str, Any]) -> None:
+# 资产类型描述：
+#   name: 数据类型（用于输出文件名）
+#   label: 日志中的中文名称
+#   list_fn: () -> 启用的标的列表
+#   fetch_fn: (标的列表) -> 按完成顺序产出 (标识符, 价格数据或None)
+#   push_fn: (价格数据) -> 是否推送成功
+AssetSpec = namedtuple('AssetSpec', 'name label list_fn fetch_fn push_fn')
+
+
+def fetch_each(fetch_pool: Executor, fetch: Callable[..., Optional[Dict[str, Any]]],
+               unpack: Callable[[Any], tuple]) -> Callable[[List[Any]], Iterator[Tuple[str, Optional[Dict[str, Any]]]]]:
     """
-    处理股票数据
+    构造逐个标的并发请求Finnhub的获取函数
     
     Args:
-        finnhub_client: Finnhub客户端
-        notion_client: Notion客户端
-        config: 配置字典
-    """
-    logger = logging.getLogger(__name__)
-    logger.info("开始处理股票数据...")
-    
-    # 从Notion获取股票配置
-    stock_symbols = notion_client.get_stock_symbols()
-    
-    if not stock_symbols:
-        logger.warning("未找到启用的股票配置")
-        return
-    
-    # 获取股票价格数据
-    stock_data = []
-    for symbol in stock_symbols:
-        logger.info(f"获取股票 {symbol} 的价格数据...")
-        quote = finnhub_client.get_stock_quote(symbol)
+        fetch_pool: 各资产类型共享的请求线程池
+        fetch: 单个标的的获取方法
+        unpack: 将标的配置转换为fetch的位置参数，第一个参数作为标识符
         
-        if quote:
-            stock_data.append(quote)
-            # 推送到Notion价格数据库
-            success = notion_client.push_stock_price(quote)
-            if success:
-                logger.info(f"股票 {symbol} 价格数据已推送到Notion")
-            else:
-                logger.error(f"股票 {symbol} 价格数据推送失败")
-        else:
-            logger.warning(f"未能获取股票 {symbol} 的价格数据")
+    Returns:
+        获取函数，报价按完成顺序产出
+    """
+    def fetch_all(items: List[Any]) -> Iterator[Tuple[str, Optional[Dict[str, Any]]]]:
+        futures = {}
+        for item in items:
+            args = unpack(item)
+            futures[fetch_pool.submit(fetch, *args)] = args[0]
         
-        # 添加延迟避免API限制
-        time.sleep(0.2)
+        for future in as_completed(futures):
+            yield futures[future], future.result()
     
-    # 保存到文件
-    save_data_to_file(stock_data, 'stocks', config)
-    logger.info(f"股票数据处理完成，共处理 {len(stock_data)} 个股票")
+    return fetch_all
 
 
-def process_forex(notion_client: NotionClient, config: Dict[str, Any]) -> None:
+def build_asset_specs(finnhub_client: FinnhubClient, notion_client: NotionClient,
+                      forex_client: ForexClient, fetch_pool: Executor) -> List[AssetSpec]:
     """
-    处理外汇数据（支持每小时更新限制）
+    构造各资产类型的处理配置
     
     Args:
+        finnhub_client: Finnhub客户端
         notion_client: Notion客户端
-        config: 配置字典
-    """
-    logger = logging.getLogger(__name__)
-    logger.info("开始处理外汇数据...")
-    
-    # 初始化免费外汇API客户端
-    forex_client = ForexClient(config)
-    
-    # 从Notion获取外汇配置及上次更新时间
-    forex_pairs_with_timestamps = notion_client.get_forex_pairs_with_timestamps()
-    
-    if not forex_pairs_with_timestamps:
-        logger.warning("未找到启用的外汇配置")
-        return
-    
-    # 获取外汇汇率数据（带时间检查）
-    forex_data = []
-    for item in forex_pairs_with_timestamps:
-        pair = item['pair']
-        last_update = item['last_update']
-        
-        logger.info(f"检查外汇 {pair} 的更新需求...")
-        rate = forex_client.get_forex_rate(pair, last_update)
+        forex_client: 外汇客户端
+        fetch_pool: 各资产类型共享的Finnhub请求线程池
         
-        if rate:
-            forex_data.append(rate)
-            # 推送到Notion价格数据库
-            success = notion_client.push_forex_price(rate)
-            if success:
-                logger.info(f"外汇 {pair} 汇率数据已更新到Notion")
-            else:
-                logger.error(f"外汇 {pair} 汇率数据推送失败")
-        else:
-            logger.debug(f"外汇 {pair} 跳过更新（时间间隔不足或API失败）")
-        
-        # 添加延迟避免API限制
-        time.sleep(0.2)
-    
-    # 保存到文件
-    save_data_to_file(forex_data, 'forex', config)
-    logger.info(f"外汇数据处理完成，共处理 {len(forex_data)} 个货币对")
+    Returns:
+        资产类型列表
+    """
+    def fetch_forex(items: List[Dict[str, Any]]) -> Iterator[Tuple[str, Optional[Dict[str, Any]]]]:
+        # 所有货币对共用一次USD汇率请求，未到更新时间的货币对不返回
+        for rate in forex_client.get_multiple_forex_rates(items):
+            yield rate['pair'], rate
+    
+    return [
+        AssetSpec(
+            'stocks', '股票',
+            notion_client.get_stock_symbols,
+            fetch_each(fetch_pool, finnhub_client.get_stock_quote, lambda symbol: (symbol,)),
+            notion_client.push_stock_price
+        ),
+        AssetSpec(
+            'forex', '外汇',
+            notion_client.get_forex_pairs_with_timestamps,
+            fetch_forex,
+            notion_client.push_forex_price
+        ),
+        AssetSpec(
+            'crypto', '加密货币',
+            notion_client.get_crypto_symbols,
+            fetch_each(fetch_pool, finnhub_client.get_crypto_price,
+                       lambda crypto: (crypto['symbol'], crypto['exchange'])),
+            notion_client.push_crypto_price
+        ),
+    ]
 
 
-def process_crypto(finnhub_client: FinnhubClient, notion_client: NotionClient, config: Dict[str, Any]) -> None:
+def process_asset(spec: AssetSpec, notion_client: NotionClient, config: Dict[str, Any]) -> None:
     """
-    处理加密货币数据
+    处理一种资产类型：读取启用的标的，获取价格并推送到Notion
     
     Args:
-        finnhub_client: Finnhub客户端
+        spec: 资产类型配置
         notion_client: Notion客户端
         config: 配置字典
     """
     logger = logging.getLogger(__name__)
-    logger.info("开始处理加密货币数据...")
+    logger.info(f"开始处理{spec.label}数据...")
     
-    # 从Notion获取加密货币配置
-    crypto_symbols = notion_client.get_crypto_symbols()
+    # 从Notion获取启用的标的
+    items = spec.list_fn()
     
-    if not crypto_symbols:
-        logger.warning("未找到启用的加密货币配置")
+    if not items:
+        logger.warning(f"未找到启用的{spec.label}配置")
         return
     
-    # 获取加密货币价格数据
-    crypto_data = []
-    for crypto in crypto_symbols:
-        symbol = crypto['symbol']
-        exchange = crypto['exchange']
-        logger.info(f"获取加密货币 {symbol} ({exchange}) 的价格数据...")
-        
-        price = finnhub_client.get_crypto_price(symbol, exchange)
-        
-        if price:
-            crypto_data.append(price)
-            # 推送到Notion价格数据库
-            success = notion_client.push_crypto_price(price)
-            if success:
-                logger.info(f"加密货币 {symbol} 价格数据已推送到Notion")
+    # 每个价格返回后立即提交推送，推送与其余请求重叠进行
+    data = []
+    pushes = {}
+    with ThreadPoolExecutor(max_workers=notion_client.max_concurrency) as push_executor:
+        for identifier, record in spec.fetch_fn(items):
+            if record:
+                data.append(record)
+                pushes[push_executor.submit(spec.push_fn, record)] = identifier
             else:
-                logger.error(f"加密货币 {symbol} 价格数据推送失败")
-        else:
-            logger.warning(f"未能获取加密货币 {symbol} 的价格数据")
+                logger.warning(f"未能获取{spec.label} {identifier} 的价格数据")
         
-        # 添加延迟避免API限制
-        time.sleep(0.2)
+        for push in as_completed(pushes):
+            identifier = pushes[push]
+            if push.result():
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"{spec.label} {identifier} 价格数据已推送到Notion")
+            else:
+                logger.error(f"{spec.label} {identifier} 价格数据推送失败")
     
     # 保存到文件
-    save_data_to_file(crypto_data, 'crypto', config)
-    logger.info(f"加密货币数据处理完成，共处理 {len(crypto_data)} 个交易对")
+    save_data_to_file(data, spec.name, config)
+    logger.info(f"{spec.label}数据处理完成，共处理 {len(data)} 条数据")
 
 
 def load_config(config_path: str = 'config.yaml') -> Dict[str, Any]:
@@ -243,13 +235,7 @@ def load_config(config_path: str = 'config.yaml') -> Dict[str, Any]:
         配置字典
     """
     try:
-        # 如果是相对路径，则相对于脚本所在目录
-        if not os.path.isabs(config_path):
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            config_path = os.path.join(script_dir, config_path)
-        
-        with open(config_path, 'r', encoding='utf-8') as f:
-            return yaml.safe_load(f)
+        return parse_config(str(resolve_path(config_path)))
     except Exception as e:
         print(f"加载配置文件失败: {e}")
         sys.exit(1)
@@ -277,10 +263,17 @@ def main():
         logger.info("初始化Notion客户端...")
         notion_client = NotionClient(config)
         
-        # 处理各类数据
-        process_stocks(finnhub_client, notion_client, config)
-        process_forex(notion_client, config)
-        process_crypto(finnhub_client, notion_client, config)
+        # 初始化免费外汇API客户端
+        forex_client = ForexClient(config)
+        
+        # 各类数据使用独立的Notion数据库，并发处理；股票与加密货币的Finnhub请求进入同一个线程池，
+        # 由客户端共享的令牌桶统一限速，整体按API的速率上限运行，而不是各自占用一份并发
+        with ThreadPoolExecutor(max_workers=finnhub_client.workers) as fetch_pool:
+            specs = build_asset_specs(finnhub_client, notion_client, forex_client, fetch_pool)
+            with ThreadPoolExecutor(max_workers=len(specs)) as executor:
+                futures = [executor.submit(process_asset, spec, notion_client, config) for spec in specs]
+                for future in futures:
+                    future.result()
         
         logger.info("NoFina 运行完成")
         
@@ -3,15 +3,129 @@ Notion数据库客户端模块
 用于从Notion数据库读取配置信息，并将价格数据推送到相应的数据库
 """
 
+import hashlib
+import json
 import logging
-from typing import List, Dict, Any, Optional
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Callable, Iterator, Tuple
 from notion_client import Client
+from notion_client.errors import HTTPResponseError
 from datetime import datetime
-import yaml
+import httpx
+
+from config_utils import parse_config
+from rate_limiter import parse_retry_after
+
+
+def _title(value: str) -> Dict[str, Any]:
+    """构建标题类型的Notion属性"""
+    return {"title": [{"text": {"content": value}}]}
+
+
+def _rich_text(value: str) -> Dict[str, Any]:
+    """构建文本类型的Notion属性"""
+    return {"rich_text": [{"text": {"content": value}}]}
+
+
+def _number(value: Any) -> Dict[str, Any]:
+    """构建数字类型的Notion属性"""
+    return {"number": value}
+
+
+# 价格数据到Notion属性的映射：(Notion列名, 数据字段, 缺省值, 属性构建函数)
+_STOCK_SCHEMA = (
+    ("Symbol", 'symbol', '', _title),
+    ("Price", 'current_price', 0, _number),
+    ("Change", 'change', 0, _number),
+    ("Percent Change", 'percent_change', 0, _number),
+    ("High", 'high', 0, _number),
+    ("Low", 'low', 0, _number),
+    ("Open", 'open', 0, _number),
+    ("Previous Close", 'previous_close', 0, _number),
+    ("Timestamp", 'timestamp', 0, _number),
+    ("DateTime", 'datetime', '', _rich_text),
+)
+
+_FOREX_SCHEMA = (
+    ("Pair", 'pair', '', _title),
+    ("Rate", 'rate', 0, _number),
+    ("Timestamp", 'timestamp', 0, _number),
+    ("DateTime", 'datetime', '', _rich_text),
+)
+
+_CRYPTO_SCHEMA = (
+    ("Symbol", 'symbol', '', _title),
+    ("Exchange", 'exchange', '', _rich_text),
+    ("Price", 'price', 0, _number),
+    ("Change", 'change', 0, _number),
+    ("Percent Change", 'percent_change', 0, _number),
+    ("High", 'high', 0, _number),
+    ("Low", 'low', 0, _number),
+    ("Open", 'open', 0, _number),
+    ("Previous Close", 'previous_close', 0, _number),
+    ("Timestamp", 'timestamp', 0, _number),
+    ("DateTime", 'datetime', '', _rich_text),
+)
+
+
+def _extract_title(prop: Dict[str, Any]) -> str:
+    """提取标题属性的文本（取第一段）"""
+    title_list = prop.get('title', [])
+    return title_list[0].get('text', {}).get('content', '') if title_list else ''
+
+
+def _extract_rich_text(prop: Dict[str, Any]) -> str:
+    """提取文本属性的内容（取第一段）"""
+    rich_text_list = prop.get('rich_text', [])
+    return rich_text_list[0].get('text', {}).get('content', '') if rich_text_list else ''
+
+
+def _extract_select(prop: Dict[str, Any]) -> str:
+    """提取单选属性的选项名称"""
+    select_obj = prop.get('select')
+    return select_obj.get('name', '') if select_obj else ''
+
+
+def _extract_checkbox(prop: Dict[str, Any]) -> bool:
+    """提取复选框属性的勾选状态"""
+    return prop.get('checkbox', False)
+
+
+def _extract_number(prop: Dict[str, Any]) -> Optional[float]:
+    """提取数字属性的值"""
+    return prop.get('number')
+
+
+# Notion属性类型到取值函数的映射
+_EXTRACTORS: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    'title': _extract_title,
+    'rich_text': _extract_rich_text,
+    'select': _extract_select,
+    'checkbox': _extract_checkbox,
+    'number': _extract_number,
+}
+
+
+@lru_cache(maxsize=16)
+def _enabled_filter(column: str) -> Dict[str, Any]:
+    """启用列为勾选状态的查询条件（各查询共享同一对象，不应修改）"""
+    return {"property": column, "checkbox": {"equals": True}}
+
+
+def _build_properties(schema, data: Dict[str, Any]) -> Dict[str, Any]:
+    """按映射表将价格数据转换为Notion页面属性"""
+    return {column: build(data.get(key, default)) for column, key, default, build in schema}
+
 
 class NotionClient:
     """Notion数据库客户端"""
     
+    # 遇到429限流时的最大重试次数
+    MAX_RETRIES = 3
+    
     def __init__(self, config: Dict[str, Any]):
         """
         初始化Notion客户端
@@ -21,36 +135,94 @@ class NotionClient:
         """
         self.config = config
         self.notion_config = config.get('notion', {})
-        self.client = Client(auth=self.notion_config.get('api_key'))
+        # 所有Notion请求复用同一个httpx连接池，keep-alive连接数与并发推送数一致
+        pool_size = self.notion_config.get('pool_size', 5)
+        # 同时进行的Notion请求数上限（Notion建议并发不超过5），由各线程共享
+        self.max_concurrency = pool_size
+        self._request_slots = threading.BoundedSemaphore(pool_size)
+        self.http_client = httpx.Client(limits=httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size
+        ))
+        self.client = Client(auth=self.notion_config.get('api_key'), client=self.http_client)
         self.logger = logging.getLogger(__name__)
         
+        # 各数据库ID与列名映射在初始化时解析一次 {stocks/forex/crypto: ...}
+        databases = self.notion_config.get('databases', {})
+        self._price_db: Dict[str, Optional[str]] = {}
+        self._columns: Dict[str, Dict[str, str]] = {}
+        for kind in ('stocks', 'forex', 'crypto'):
+            db_config = databases.get(kind, {})
+            self._price_db[kind] = db_config.get('database_id')
+            self._columns[kind] = db_config.get('columns', {})
+        
+        # 配置数据库的标的列表缓存（跨运行），ttl_seconds为0时禁用
+        cache_config = config.get('cache', {})
+        self._symbol_cache_ttl = cache_config.get('ttl_seconds', 600)
+        self._symbol_cache_dir = os.path.expanduser(cache_config.get('dir', '~/.nofina_cache'))
+        
+        # 价格页面缓存 {database_id: {标识符值: (page_id, 上次推送的Timestamp)}}，每个数据库首次写入时批量预取
+        self._page_id_cache: Dict[str, Dict[str, Tuple[str, Optional[float]]]] = {}
+        self._page_id_cache_lock = threading.Lock()
+        # 进行中的页面预取 {database_id: Event}，同一数据库的并发预取合并为一次
+        self._prefetch_in_flight: Dict[str, threading.Event] = {}
+        
         if not self.notion_config.get('api_key'):
             self.logger.error("Notion API密钥未配置")
             raise ValueError("Notion API密钥未配置")
     
-    def query_database(self, database_id: str, filter_conditions: Optional[Dict] = None) -> List[Dict]:
+    def _call_with_retry(self, func: Callable[..., Any], **kwargs) -> Any:
         """
-        查询Notion数据库
+        调用Notion API，遇到429限流时按Retry-After（或指数退避）等待后重试
+        
+        并发调用时最多同时进行max_concurrency个请求，退避等待期间不占用名额。
         
         Args:
-            database_id: 数据库ID
-            filter_conditions: 过滤条件
+            func: Notion API方法
+            **kwargs: 调用参数
             
         Returns:
-            查询结果列表
+            API响应
         """
-        try:
-            query_params = {"database_id": database_id}
-            
-            if filter_conditions:
-                query_params["filter"] = filter_conditions
+        for attempt in range(self.MAX_RETRIES + 1):
+            try:
+                with self._request_slots:
+                    return func(**kwargs)
+            except HTTPResponseError as e:
+                if e.status != 429 or attempt == self.MAX_RETRIES:
+                    raise
+                
+                wait = parse_retry_after(e.headers.get('Retry-After'))
+                if wait is None:
+                    wait = 2 ** attempt
+                self.logger.warning(f"Notion请求被限流，{wait} 秒后重试")
+                time.sleep(wait)
+    
+    def iter_query_database(self, database_id: str, filter_conditions: Optional[Dict] = None,
+                            page_size: int = 100) -> Iterator[Dict]:
+        """
+        分页查询Notion数据库，逐条惰性返回页面
+        
+        Args:
+            database_id: 数据库ID
+            filter_conditions: 过滤条件
+            page_size: 每次请求的页面数（Notion上限为100）
             
-            response = self.client.databases.query(**query_params)
-            return response.get('results', [])
+        Yields:
+            页面数据
+        """
+        query_params = {"database_id": database_id, "page_size": page_size}
         
-        except Exception as e:
-            self.logger.error(f"查询数据库失败: {e}")
-            return []
+        if filter_conditions:
+            query_params["filter"] = filter_conditions
+        
+        while True:
+            response = self._call_with_retry(self.client.databases.query, **query_params)
+            yield from response.get('results', [])
+            
+            if not response.get('has_more'):
+                break
+            query_params["start_cursor"] = response.get('next_cursor')
     
     def extract_property_value(self, page: Dict, property_name: str) -> Optional[str]:
         """
@@ -61,39 +233,107 @@ class NotionClient:
             property_name: 属性名称
             
         Returns:
-            属性值
+            属性值，属性不存在或类型不受支持时返回None
         """
-        try:
-            properties = page.get('properties', {})
-            prop = properties.get(property_name, {})
-            prop_type = prop.get('type')
-            
-            if prop_type == 'title':
-                title_list = prop.get('title', [])
-                return title_list[0].get('text', {}).get('content', '') if title_list else ''
+        return self.extract_values(page, {'value': property_name})['value']
+    
+    def extract_values(self, page: Dict, spec: Dict[str, str]) -> Dict[str, Any]:
+        """
+        一次性从页面属性中提取多个值
+        
+        Args:
+            page: 页面数据
+            spec: {结果键: 属性名称}
             
-            elif prop_type == 'rich_text':
-                rich_text_list = prop.get('rich_text', [])
-                return rich_text_list[0].get('text', {}).get('content', '') if rich_text_list else ''
+        Returns:
+            {结果键: 属性值}，页面中不存在的属性取值为None
+        """
+        properties = page.get('properties', {})
+        values = {}
+        
+        for key, property_name in spec.items():
+            prop = properties.get(property_name)
+            if prop is None:
+                values[key] = None
+                continue
+            
+            extractor = _EXTRACTORS.get(prop.get('type'))
+            if extractor is None:
+                self.logger.warning(f"不支持的属性类型: {prop.get('type')}")
+                values[key] = None
+                continue
+            
+            try:
+                values[key] = extractor(prop)
+            except Exception as e:
+                self.logger.error(f"提取属性值失败: {e}")
+                values[key] = None
+        
+        return values
+    
+    def _symbol_cache_key(self, kind: str) -> str:
+        """
+        标的列表缓存的配置指纹，数据库ID或列名映射变化后旧缓存即失效
+        
+        Args:
+            kind: 数据类型 (stocks, forex, crypto)
             
-            elif prop_type == 'select':
-                select_obj = prop.get('select')
-                return select_obj.get('name', '') if select_obj else ''
+        Returns:
+            配置指纹
+        """
+        source = repr((self._price_db[kind], tuple(sorted(self._columns[kind].items()))))
+        return hashlib.sha1(source.encode('utf-8')).hexdigest()
+    
+    def _load_symbol_cache(self, kind: str) -> Optional[List[Any]]:
+        """
+        读取标的列表缓存文件（未过期且对应同一数据库及列名映射时有效）
+        
+        Args:
+            kind: 数据类型 (stocks, forex, crypto)
             
-            elif prop_type == 'checkbox':
-                return prop.get('checkbox', False)
+        Returns:
+            缓存的标的列表，无有效缓存时返回None
+        """
+        if not self._symbol_cache_ttl:
+            return None
+        
+        cache_file = os.path.join(self._symbol_cache_dir, f"symbols_{kind}.json")
+        try:
+            if time.time() - os.path.getmtime(cache_file) >= self._symbol_cache_ttl:
+                return None
             
-            elif prop_type == 'number':
-                return prop.get('number')
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
             
-            else:
-                self.logger.warning(f"不支持的属性类型: {prop_type}")
+            if cached.get('key') != self._symbol_cache_key(kind):
                 return None
-                
-        except Exception as e:
-            self.logger.error(f"提取属性值失败: {e}")
+            
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(f"使用缓存的 {kind} 标的列表: {cache_file}")
+            return cached.get('data')
+            
+        except (OSError, ValueError):
             return None
     
+    def _save_symbol_cache(self, kind: str, data: List[Any]) -> None:
+        """
+        写入标的列表缓存文件
+        
+        Args:
+            kind: 数据类型 (stocks, forex, crypto)
+            data: 标的列表
+        """
+        if not self._symbol_cache_ttl or not data:
+            return
+        
+        cache_file = os.path.join(self._symbol_cache_dir, f"symbols_{kind}.json")
+        try:
+            os.makedirs(self._symbol_cache_dir, exist_ok=True)
+            with open(cache_file, 'w', encoding='utf-8') as f:
+                json.dump({'key': self._symbol_cache_key(kind), 'data': data}, f, ensure_ascii=False)
+        except OSError as e:
+            self.logger.warning(f"写入标的列表缓存失败: {e}")
+    
     def get_stock_symbols(self) -> List[str]:
         """
         从Notion配置数据库获取股票代码列表
@@ -101,32 +341,30 @@ class NotionClient:
         Returns:
             股票代码列表
         """
+        cached = self._load_symbol_cache('stocks')
+        if cached is not None:
+            return cached
+        
         try:
-            db_config = self.notion_config.get('databases', {}).get('stocks', {})
-            database_id = db_config.get('database_id')
-            columns = db_config.get('columns', {})
+            database_id = self._price_db['stocks']
+            columns = self._columns['stocks']
             
             if not database_id:
                 self.logger.warning("未配置股票配置数据库ID")
                 return []
             
-            # 查询启用的股票
-            filter_conditions = {
-                "property": columns.get('enabled', 'Enabled'),
-                "checkbox": {
-                    "equals": True
-                }
-            }
-            
-            pages = self.query_database(database_id, filter_conditions)
+            # 只查询启用的记录
+            pages = self.iter_query_database(database_id, _enabled_filter(columns.get('enabled', 'Enabled')))
+            spec = {'symbol': columns.get('symbol', 'Symbol')}
             symbols = []
             
             for page in pages:
-                symbol = self.extract_property_value(page, columns.get('symbol', 'Symbol'))
+                symbol = self.extract_values(page, spec)['symbol']
                 if symbol:
                     symbols.append(symbol.upper())
             
             self.logger.info(f"从Notion获取到 {len(symbols)} 个股票代码")
+            self._save_symbol_cache('stocks', symbols)
             return symbols
             
         except Exception as e:
@@ -140,32 +378,30 @@ class NotionClient:
         Returns:
             外汇货币对列表
         """
+        cached = self._load_symbol_cache('forex')
+        if cached is not None:
+            return cached
+        
         try:
-            db_config = self.notion_config.get('databases', {}).get('forex', {})
-            database_id = db_config.get('database_id')
-            columns = db_config.get('columns', {})
+            database_id = self._price_db['forex']
+            columns = self._columns['forex']
             
             if not database_id:
                 self.logger.warning("未配置外汇配置数据库ID")
                 return []
             
-            # 查询启用的货币对
-            filter_conditions = {
-                "property": columns.get('enabled', 'Enabled'),
-                "checkbox": {
-                    "equals": True
-                }
-            }
-            
-            pages = self.query_database(database_id, filter_conditions)
+            # 只查询启用的记录
+            pages = self.iter_query_database(database_id, _enabled_filter(columns.get('enabled', 'Enabled')))
+            spec = {'pair': columns.get('pair', 'Pair')}
             pairs = []
             
             for page in pages:
-                pair = self.extract_property_value(page, columns.get('pair', 'Pair'))
+                pair = self.extract_values(page, spec)['pair']
                 if pair:
                     pairs.append(pair.upper())
             
             self.logger.info(f"从Notion获取到 {len(pairs)} 个外汇货币对")
+            self._save_symbol_cache('forex', pairs)
             return pairs
             
         except Exception as e:
@@ -180,32 +416,24 @@ class NotionClient:
             包含货币对和上次更新时间戳的列表
         """
         try:
-            db_config = self.notion_config.get('databases', {}).get('forex', {})
-            database_id = db_config.get('database_id')
-            columns = db_config.get('columns', {})
+            database_id = self._price_db['forex']
+            columns = self._columns['forex']
             
             if not database_id:
                 self.logger.warning("未配置外汇配置数据库ID")
                 return []
             
-            # 查询启用的货币对
-            filter_conditions = {
-                "property": columns.get('enabled', 'Enabled'),
-                "checkbox": {
-                    "equals": True
-                }
-            }
-            
-            pages = self.query_database(database_id, filter_conditions)
+            # 只查询启用的记录
+            pages = self.iter_query_database(database_id, _enabled_filter(columns.get('enabled', 'Enabled')))
+            spec = {'pair': columns.get('pair', 'Pair'), 'last_update': 'Timestamp'}
             pairs_with_timestamps = []
             
             for page in pages:
-                pair = self.extract_property_value(page, columns.get('pair', 'Pair'))
+                row = self.extract_values(page, spec)
+                pair = row['pair']
                 if pair:
-                    # 获取上次更新时间戳
-                    last_update = self.extract_property_value(page, 'Timestamp')
-                    if last_update is None:
-                        last_update = 0  # 如果没有时间戳，设为0表示需要更新
+                    # 上次更新时间戳，没有时间戳时设为0表示需要更新
+                    last_update = row['last_update']
                     
                     pairs_with_timestamps.append({
                         'pair': pair.upper(),
@@ -226,29 +454,30 @@ class NotionClient:
         Returns:
             加密货币交易对列表，包含symbol和exchange信息
         """
+        cached = self._load_symbol_cache('crypto')
+        if cached is not None:
+            return cached
+        
         try:
-            db_config = self.notion_config.get('databases', {}).get('crypto', {})
-            database_id = db_config.get('database_id')
-            columns = db_config.get('columns', {})
+            database_id = self._price_db['crypto']
+            columns = self._columns['crypto']
             
             if not database_id:
                 self.logger.warning("未配置加密货币配置数据库ID")
                 return []
             
-            # 查询启用的加密货币
-            filter_conditions = {
-                "property": columns.get('enabled', 'Enabled'),
-                "checkbox": {
-                    "equals": True
-                }
+            # 只查询启用的记录
+            pages = self.iter_query_database(database_id, _enabled_filter(columns.get('enabled', 'Enabled')))
+            spec = {
+                'symbol': columns.get('symbol', 'Symbol'),
+                'exchange': columns.get('exchange', 'Exchange')
             }
-            
-            pages = self.query_database(database_id, filter_conditions)
             crypto_list = []
             
             for page in pages:
-                symbol = self.extract_property_value(page, columns.get('symbol', 'Symbol'))
-                exchange = self.extract_property_value(page, columns.get('exchange', 'Exchange'))
+                row = self.extract_values(page, spec)
+                symbol = row['symbol']
+                exchange = row['exchange']
                 
                 if symbol:
                     crypto_list.append({
@@ -257,15 +486,100 @@ class NotionClient:
                     })
             
             self.logger.info(f"从Notion获取到 {len(crypto_list)} 个加密货币交易对")
+            self._save_symbol_cache('crypto', crypto_list)
             return crypto_list
             
         except Exception as e:
             self.logger.error(f"获取加密货币交易对失败: {e}")
             return []
     
+    def _prefetch_page_ids(self, database_id: str, identifier_property: str) -> Optional[Dict[str, Tuple[str, Optional[float]]]]:
+        """
+        分页读取数据库全部页面，建立标识符到页面ID及上次推送时间戳的映射
+        
+        Args:
+            database_id: 数据库ID
+            identifier_property: 标识符属性名（标题列）
+            
+        Returns:
+            {标识符值: (page_id, Timestamp)}，查询失败时返回None
+        """
+        try:
+            spec = {'value': identifier_property, 'timestamp': 'Timestamp'}
+            page_ids = {}
+            for page in self.iter_query_database(database_id):
+                row = self.extract_values(page, spec)
+                if row['value']:
+                    page_ids.setdefault(row['value'], (page['id'], row['timestamp']))
+            
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(f"已预取数据库 {database_id} 的 {len(page_ids)} 个页面ID")
+            return page_ids
+            
+        except Exception as e:
+            self.logger.error(f"预取页面ID失败: {e}")
+            return None
+    
+    def _get_page_id_cache(self, database_id: str, identifier_property: str) -> Optional[Dict[str, Tuple[str, Optional[float]]]]:
+        """
+        获取数据库的页面缓存，首次访问时预取
+        
+        并发推送同一数据库时只由一个线程预取，其余线程等待其结果。
+        
+        Args:
+            database_id: 数据库ID
+            identifier_property: 标识符属性名
+            
+        Returns:
+            {标识符值: (page_id, Timestamp)}，预取失败时返回None
+        """
+        with self._page_id_cache_lock:
+            cache = self._page_id_cache.get(database_id)
+            if cache is not None:
+                return cache
+            
+            event = self._prefetch_in_flight.get(database_id)
+            is_leader = event is None
+            if is_leader:
+                event = threading.Event()
+                self._prefetch_in_flight[database_id] = event
+        
+        if not is_leader:
+            # 已有线程在预取，等待其完成后直接读取缓存
+            event.wait()
+            with self._page_id_cache_lock:
+                return self._page_id_cache.get(database_id)
+        
+        # 预取在锁外进行，不阻塞其他数据库的写入
+        try:
+            cache = self._prefetch_page_ids(database_id, identifier_property)
+            if cache is not None:
+                with self._page_id_cache_lock:
+                    self._page_id_cache[database_id] = cache
+            return cache
+        finally:
+            with self._page_id_cache_lock:
+                self._prefetch_in_flight.pop(database_id, None)
+            event.set()
+    
+    def _remember_page(self, database_id: str, identifier_value: str, page_id: str, timestamp: Optional[float]) -> None:
+        """
+        记录页面ID及本次推送的时间戳到页面缓存
+        
+        Args:
+            database_id: 数据库ID
+            identifier_value: 标识符值
+            page_id: 页面ID
+            timestamp: 本次推送的Timestamp
+        """
+        with self._page_id_cache_lock:
+            cache = self._page_id_cache.get(database_id)
+            if cache is not None:
+                cache[identifier_value] = (page_id, timestamp)
+    
     def find_existing_page(self, database_id: str, identifier_property: str, identifier_value: str) -> Optional[Dict[str, Any]]:
         """
-        查找数据库中是否存在指定标识符的页面
+        查找数据库中是否存在指定标识符的页面（优先使用页面ID缓存）
         
         Args:
             database_id: 数据库ID
@@ -273,8 +587,14 @@ class NotionClient:
             identifier_value: 标识符值
             
         Returns:
-            页面信息（如果存在），包含id和properties，否则返回None
+            页面信息（如果存在），至少包含id（命中缓存时还包含上次推送的timestamp），否则返回None
         """
+        cache = self._get_page_id_cache(database_id, identifier_property)
+        if cache is not None:
+            cached = cache.get(identifier_value)
+            return {'id': cached[0], 'timestamp': cached[1]} if cached else None
+        
+        # 预取失败时回退到按标识符查询
         try:
             filter_conditions = {
                 "property": identifier_property,
@@ -283,8 +603,7 @@ class NotionClient:
                 }
             }
             
-            pages = self.query_database(database_id, filter_conditions)
-            return pages[0] if pages else None
+            return next(self.iter_query_database(database_id, filter_conditions, page_size=1), None)
             
         except Exception as e:
             self.logger.error(f"查找现有页面失败: {e}")
@@ -302,7 +621,8 @@ class NotionClient:
             是否更新成功
         """
         try:
-            self.client.pages.update(
+            self._call_with_retry(
+                self.client.pages.update,
                 page_id=page_id,
                 properties=properties
             )
@@ -311,26 +631,40 @@ class NotionClient:
             self.logger.error(f"更新页面失败: {e}")
             return False
     
-    def create_price_page(self, database_id: str, properties: Dict[str, Any]) -> bool:
+    def _create_page(self, database_id: str, properties: Dict[str, Any]) -> Optional[str]:
         """
-        在价格数据库中创建页面
+        在数据库中创建页面
         
         Args:
             database_id: 数据库ID
             properties: 页面属性
             
         Returns:
-            是否创建成功
+            新页面ID，失败时返回None
         """
         try:
-            response = self.client.pages.create(
+            response = self._call_with_retry(
+                self.client.pages.create,
                 parent={"database_id": database_id},
                 properties=properties
             )
-            return True
+            return response.get('id')
         except Exception as e:
             self.logger.error(f"创建价格页面失败: {e}")
-            return False
+            return None
+    
+    def create_price_page(self, database_id: str, properties: Dict[str, Any]) -> bool:
+        """
+        在价格数据库中创建页面
+        
+        Args:
+            database_id: 数据库ID
+            properties: 页面属性
+            
+        Returns:
+            是否创建成功
+        """
+        return self._create_page(database_id, properties) is not None
     
     def upsert_price_page(self, database_id: str, identifier_property: str, identifier_value: str, properties: Dict[str, Any]) -> bool:
         """
@@ -348,20 +682,34 @@ class NotionClient:
         try:
             # 查找现有页面
             existing_page = self.find_existing_page(database_id, identifier_property, identifier_value)
+            timestamp = properties.get('Timestamp', {}).get('number')
             
             if existing_page:
+                # 时间戳未前进（如休市期间报价未变化）时跳过写入
+                last_timestamp = existing_page.get('timestamp')
+                if timestamp and last_timestamp and timestamp <= last_timestamp:
+                    if self.logger.isEnabledFor(logging.DEBUG):
+                        self.logger.debug(f"数据未更新，跳过推送: {identifier_value}")
+                    return True
+                
                 # 更新现有页面（排除标识符属性，避免重复设置）
                 update_properties = {k: v for k, v in properties.items() if k != identifier_property}
                 success = self.update_page(existing_page['id'], update_properties)
                 if success:
-                    self.logger.debug(f"已更新现有页面: {identifier_value}")
+                    self._remember_page(database_id, identifier_value, existing_page['id'], timestamp)
+                    if self.logger.isEnabledFor(logging.DEBUG):
+                        self.logger.debug(f"已更新现有页面: {identifier_value}")
                 return success
             else:
-                # 创建新页面
-                success = self.create_price_page(database_id, properties)
-                if success:
+                # 创建新页面，并记录到页面缓存，避免后续重复创建
+                page_id = self._create_page(database_id, properties)
+                if page_id is None:
+                    return False
+                
+                self._remember_page(database_id, identifier_value, page_id, timestamp)
+                if self.logger.isEnabledFor(logging.DEBUG):
                     self.logger.debug(f"已创建新页面: {identifier_value}")
-                return success
+                return True
                 
         except Exception as e:
             self.logger.error(f"更新或插入价格页面失败: {e}")
@@ -379,44 +727,13 @@ class NotionClient:
         """
         try:
             # 使用股票配置数据库作为价格数据库
-            price_db_id = self.notion_config.get('databases', {}).get('stocks', {}).get('database_id')
+            price_db_id = self._price_db['stocks']
             if not price_db_id:
                 self.logger.error("未配置股票数据库ID")
                 return False
             
             symbol = stock_data.get('symbol', '')
-            properties = {
-                "Symbol": {
-                    "title": [{"text": {"content": symbol}}]
-                },
-                "Price": {
-                    "number": stock_data.get('current_price', 0)
-                },
-                "Change": {
-                    "number": stock_data.get('change', 0)
-                },
-                "Percent Change": {
-                    "number": stock_data.get('percent_change', 0)
-                },
-                "High": {
-                    "number": stock_data.get('high', 0)
-                },
-                "Low": {
-                    "number": stock_data.get('low', 0)
-                },
-                "Open": {
-                    "number": stock_data.get('open', 0)
-                },
-                "Previous Close": {
-                    "number": stock_data.get('previous_close', 0)
-                },
-                "Timestamp": {
-                    "number": stock_data.get('timestamp', 0)
-                },
-                "DateTime": {
-                    "rich_text": [{"text": {"content": stock_data.get('datetime', '')}}]
-                }
-            }
+            properties = _build_properties(_STOCK_SCHEMA, stock_data)
             
             return self.upsert_price_page(price_db_id, "Symbol", symbol, properties)
             
@@ -436,26 +753,13 @@ class NotionClient:
         """
         try:
             # 使用外汇配置数据库作为价格数据库
-            price_db_id = self.notion_config.get('databases', {}).get('forex', {}).get('database_id')
+            price_db_id = self._price_db['forex']
             if not price_db_id:
                 self.logger.error("未配置外汇数据库ID")
                 return False
             
             pair = forex_data.get('pair', '')
-            properties = {
-                "Pair": {
-                    "title": [{"text": {"content": pair}}]
-                },
-                "Rate": {
-                    "number": forex_data.get('rate', 0)
-                },
-                "Timestamp": {
-                    "number": forex_data.get('timestamp', 0)
-                },
-                "DateTime": {
-                    "rich_text": [{"text": {"content": forex_data.get('datetime', '')}}]
-                }
-            }
+            properties = _build_properties(_FOREX_SCHEMA, forex_data)
             
             return self.upsert_price_page(price_db_id, "Pair", pair, properties)
             
@@ -475,47 +779,13 @@ class NotionClient:
         """
         try:
             # 使用加密货币配置数据库作为价格数据库
-            price_db_id = self.notion_config.get('databases', {}).get('crypto', {}).get('database_id')
+            price_db_id = self._price_db['crypto']
             if not price_db_id:
                 self.logger.error("未配置加密货币数据库ID")
                 return False
             
             symbol = crypto_data.get('symbol', '')
-            properties = {
-                "Symbol": {
-                    "title": [{"text": {"content": symbol}}]
-                },
-                "Exchange": {
-                    "rich_text": [{"text": {"content": crypto_data.get('exchange', '')}}]
-                },
-                "Price": {
-                    "number": crypto_data.get('price', 0)
-                },
-                "Change": {
-                    "number": crypto_data.get('change', 0)
-                },
-                "Percent Change": {
-                    "number": crypto_data.get('percent_change', 0)
-                },
-                "High": {
-                    "number": crypto_data.get('high', 0)
-                },
-                "Low": {
-                    "number": crypto_data.get('low', 0)
-                },
-                "Open": {
-                    "number": crypto_data.get('open', 0)
-                },
-                "Previous Close": {
-                    "number": crypto_data.get('previous_close', 0)
-                },
-                "Timestamp": {
-                    "number": crypto_data.get('timestamp', 0)
-                },
-                "DateTime": {
-                    "rich_text": [{"text": {"content": crypto_data.get('datetime', '')}}]
-                }
-            }
+            properties = _build_properties(_CRYPTO_SCHEMA, crypto_data)
             
             return self.upsert_price_page(price_db_id, "Symbol", symbol, properties)
             
@@ -535,8 +805,7 @@ def load_config(config_path: str = 'config.yaml') -> Dict[str, Any]:
         配置字典
     """
     try:
-        with open(config_path, 'r', encoding='utf-8') as f:
-            return yaml.safe_load(f)
+        return parse_config(config_path)
     except Exception as e:
         logging.error(f"加载配置文件失败: {e}")
         return {}
@@ -0,0 +1,186 @@
+"""
+限流模块
+为并发API请求提供令牌桶速率限制、AIMD自适应并发控制与熔断
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+
+class CircuitOpenError(Exception):
+    """熔断期间拒绝请求"""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    解析Retry-After响应头（仅支持秒数格式）
+
+    Args:
+        value: 响应头的值
+
+    Returns:
+        等待秒数，无法解析时返回None
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶速率限制器
+
+    所有线程共享同一个桶，保证并发请求的总速率不超过上限。
+    """
+
+    def __init__(self, capacity: float, refill_per_sec: float):
+        """
+        初始化令牌桶
+
+        Args:
+            capacity: 桶容量（允许的最大突发请求数）
+            refill_per_sec: 每秒补充的令牌数
+
+        Raises:
+            ValueError: 容量或补充速率不为正数
+        """
+        if capacity <= 0 or refill_per_sec <= 0:
+            raise ValueError("令牌桶的容量和补充速率必须为正数")
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """
+        获取令牌，令牌不足时阻塞等待
+
+        Args:
+            tokens: 需要的令牌数（可按接口权重设置）
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_per_sec)
+                self._updated = now
+
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+
+                wait = (tokens - self._tokens) / self.refill_per_sec
+
+            time.sleep(wait)
+
+
+class AimdLimiter:
+    """
+    AIMD并发控制器
+
+    成功时加性增加允许的并发数，遇到429/5xx/超时时乘性减少；
+    连续失败达到阈值后熔断，在Retry-After（或默认冷却时间）内直接拒绝请求。
+    """
+
+    def __init__(self, initial: Optional[float] = None, c_min: int = 1, c_max: int = 16,
+                 alpha: float = 0.5, beta: float = 0.5,
+                 failure_threshold: int = 3, cooldown: float = 30.0):
+        """
+        初始化并发控制器
+
+        Args:
+            initial: 初始并发数，默认从c_max开始，遇到限流或错误时再乘性减少
+            c_min: 最小并发数
+            c_max: 最大并发数
+            alpha: 加性增加系数（每个并发窗口增加的并发数）
+            beta: 乘性减少系数
+            failure_threshold: 触发熔断的连续失败次数
+            cooldown: 未提供Retry-After时的熔断时长（秒）
+        """
+        self.c_min = c_min
+        self.c_max = c_max
+        self.alpha = alpha
+        self.beta = beta
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        # 从上限开始：加性增加每个窗口只加alpha，从1开始需要很多次成功才能达到可用的并发
+        self.c = float(min(c_max, max(c_min, c_max if initial is None else initial)))
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._failures = 0
+        self._open_until = 0.0
+
+    @property
+    def limit(self) -> int:
+        """当前允许的并发数"""
+        return int(self.c)
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """
+        占用一个并发槽位，超出当前并发数时阻塞等待
+
+        Raises:
+            CircuitOpenError: 熔断期间
+        """
+        with self._cond:
+            while self._in_flight >= int(self.c):
+                self._cond.wait()
+
+            remaining = self._open_until - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(f"熔断中，{remaining:.1f} 秒后恢复")
+
+            self._in_flight += 1
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify()
+
+    def on_success(self) -> None:
+        """请求成功：加性增加并发数"""
+        with self._cond:
+            self._failures = 0
+            previous = int(self.c)
+            self.c = min(self.c_max, self.c + self.alpha / self.c)
+            if int(self.c) > previous:
+                self._cond.notify_all()
+
+    def on_error(self, retry_after: Optional[float] = None) -> None:
+        """
+        请求被限流或服务端出错：乘性减少并发数，连续失败时熔断
+
+        Args:
+            retry_after: 服务端建议的等待秒数
+        """
+        with self._cond:
+            self.c = max(self.c_min, self.c * self.beta)
+            self._failures += 1
+
+            if self._failures >= self.failure_threshold:
+                wait = retry_after if retry_after is not None else self.cooldown
+                self._open_until = time.monotonic() + wait
+                self._failures = 0
+
+    def observe(self, status_code: int, retry_after: Optional[str] = None) -> None:
+        """
+        根据HTTP状态码反馈请求结果
+
+        Args:
+            status_code: 响应状态码
+            retry_after: Retry-After响应头的值
+        """
+        if status_code == 429 or status_code >= 500:
+            self.on_error(parse_retry_after(retry_after))
+        else:
+            self.on_success()